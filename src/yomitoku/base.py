@@ -1,3 +1,6 @@
+import hashlib
+import os
+import tempfile
 import time
 from pathlib import Path
 from typing import Union
@@ -6,6 +9,7 @@ import torch
 from omegaconf import OmegaConf
 from pydantic import BaseModel, Extra
 
+from .constants import ONNX_CACHE_DIR, SUPPORT_BACKEND
 from .export import export_json
 from .utils.logger import set_logger
 
@@ -72,6 +76,10 @@ class BaseModule:
         if len(self.model_catalog.list_model()) == 0:
             raise ValueError("No model is registered.")
 
+        self.use_compile = False
+        self.backend = "torch"
+        self.session = None
+
     def __new__(cls, *args, **kwds):
         logger.info(f"Initialize {cls.__name__}")
         cls.__call__ = observer(cls, cls.__call__)
@@ -85,6 +93,110 @@ class BaseModule:
         else:
             self.model = Net(cfg=self._cfg)
 
+    def compile(self, mode="reduce-overhead", dynamic=None):
+        if self.backend != "torch":
+            logger.warning("torch.compile is only supported on torch backend.")
+            return
+
+        if self.device.type != "cuda":
+            logger.warning("torch.compile is only supported on CUDA. Skip compile.")
+            return
+
+        self.model = torch.compile(
+            self.model, mode=mode, dynamic=dynamic, fullgraph=False
+        )
+        self.use_compile = True
+
+    def setup_backend(self, backend, input_shape, output_names, dynamic_axes):
+        if backend not in SUPPORT_BACKEND:
+            raise ValueError(
+                f"Invalid backend: {backend}. Supported backends are {SUPPORT_BACKEND}"
+            )
+
+        self.backend = backend
+        if self.backend == "torch":
+            return
+
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                "onnxruntime is required for ort/trt backend. "
+                "Please install it with `pip install yomitoku[onnx]`."
+            ) from e
+
+        os.makedirs(ONNX_CACHE_DIR, exist_ok=True)
+        filename = self._cfg.hf_hub_repo.split("/")[-1]
+        path_onnx = os.path.join(
+            ONNX_CACHE_DIR, f"{filename}_{self.model_digest()}.onnx"
+        )
+
+        self.output_names = output_names
+        if not os.path.exists(path_onnx):
+            dummy_input = torch.zeros(input_shape, device=self.device)
+            logger.info(f"Export ONNX model: {path_onnx}")
+
+            # 複数プロセスから同時に書き出されても壊れたファイルを読まないよう、
+            # 一時ファイルへ出力してから置き換える
+            fd, path_tmp = tempfile.mkstemp(dir=ONNX_CACHE_DIR, suffix=".onnx")
+            os.close(fd)
+            try:
+                torch.onnx.export(
+                    self.model,
+                    dummy_input,
+                    path_tmp,
+                    opset_version=17,
+                    input_names=["input"],
+                    output_names=self.output_names,
+                    dynamic_axes={"input": dynamic_axes},
+                    # dynamoベースのエクスポーターはdynamic_axesを無視してバッチサイズを固定するため、
+                    # TorchScriptベースのエクスポーターを明示的に使う
+                    dynamo=False,
+                )
+                os.replace(path_tmp, path_onnx)
+            finally:
+                if os.path.exists(path_tmp):
+                    os.remove(path_tmp)
+
+        providers = ["CPUExecutionProvider"]
+        if self.device.type == "cuda":
+            providers.insert(0, "CUDAExecutionProvider")
+            if self.backend == "trt":
+                providers.insert(
+                    0,
+                    (
+                        "TensorrtExecutionProvider",
+                        {
+                            "trt_fp16_enable": True,
+                            "trt_engine_cache_enable": True,
+                            "trt_engine_cache_path": ONNX_CACHE_DIR,
+                        },
+                    ),
+                )
+
+        self.session = onnxruntime.InferenceSession(path_onnx, providers=providers)
+
+    def model_digest(self):
+        """設定と重みから、エクスポートしたモデルを識別するハッシュ値を求める"""
+
+        digest = hashlib.sha256(OmegaConf.to_yaml(self._cfg).encode("utf-8"))
+        for name, tensor in self.model.state_dict().items():
+            digest.update(name.encode("utf-8"))
+            digest.update(tensor.detach().cpu().numpy().tobytes())
+
+        return digest.hexdigest()[:16]
+
+    def infer(self, tensor):
+        if self.session is None:
+            return self.model(tensor)
+
+        outputs = self.session.run(None, {"input": tensor.detach().cpu().numpy()})
+
+        return {
+            name: torch.from_numpy(output).to(self.device)
+            for name, output in zip(self.output_names, outputs)
+        }
+
     def save_config(self, path_cfg):
         OmegaConf.save(self._cfg, path_cfg)
 
@@ -1,80 +1,369 @@
 import argparse
+import multiprocessing
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import closing
 from pathlib import Path
+from queue import Empty, Queue
+from threading import Thread
 
 import cv2
 import time
 
-from ..constants import SUPPORT_OUTPUT_FORMAT
-from ..data.functions import load_image, load_pdf
+from ..constants import SUPPORT_BACKEND, SUPPORT_OUTPUT_FORMAT
+from ..data.functions import iter_pdf, load_image
 from ..document_analyzer import DocumentAnalyzer
 from ..utils.logger import set_logger
 
 logger = set_logger(__name__, "INFO")
 
+# 書き出し待ちのタスク数の上限。超えた場合は古いものから完了を待つ
+MAX_PENDING_WRITES = 8
 
-def process_single_file(args, analyzer, path, format):
+
+def load_inputs(path):
     if path.suffix[1:].lower() in ["pdf"]:
-        imgs = load_pdf(path)
-    else:
-        imgs = [load_image(path)]
+        return iter_pdf(path)
 
-    for page, img in enumerate(imgs):
-        results, ocr, layout = analyzer(img)
+    return [load_image(path)]
 
-        dirname = path.parent.name
-        filename = path.stem
 
-        if ocr is not None:
-            out_path = os.path.join(
-                args.outdir, f"{dirname}_{filename}_p{page+1}_ocr.jpg"
-            )
+_END = object()
 
-            cv2.imwrite(out_path, ocr)
-            logger.info(f"Output file: {out_path}")
 
-        if layout is not None:
-            out_path = os.path.join(
-                args.outdir, f"{dirname}_{filename}_p{page+1}_layout.jpg"
-            )
+def prefetch(executor, iterable):
+    """
+    イテレータの次の要素をスレッドプール上で1つ先読みする。
+    クローズ時は先読み中の要素を待ってから元のイテレータを閉じる。
+    """
 
-            cv2.imwrite(out_path, layout)
-            logger.info(f"Output file: {out_path}")
+    iterator = iter(iterable)
+    future = executor.submit(next, iterator, _END)
+    try:
+        while True:
+            item = future.result()
+            if item is _END:
+                return
 
-        out_path = os.path.join(args.outdir, f"{dirname}_{filename}_p{page+1}.{format}")
+            future = executor.submit(next, iterator, _END)
+            yield item
+    finally:
+        future.exception()
+        if hasattr(iterator, "close"):
+            iterator.close()
 
-        if format == "json":
-            results.to_json(
-                out_path,
-                ignore_line_break=args.ignore_line_break,
-            )
-        elif format == "csv":
-            results.to_csv(
-                out_path,
-                ignore_line_break=args.ignore_line_break,
+
+def get_output_prefix(args, path):
+    return os.path.join(args.outdir, f"{path.parent.name}_{path.stem}")
+
+
+def save_image(out_path, img):
+    success, buffer = cv2.imencode(".jpg", img)
+    if not success:
+        raise ValueError(f"Failed to encode image: {out_path}")
+
+    with open(out_path, "wb") as f:
+        f.write(buffer.tobytes())
+
+    logger.info(f"Output file: {out_path}")
+
+
+def get_result_writer(args, format):
+    ignore_line_break = args.ignore_line_break
+    figure_kwargs = {
+        "export_figure": args.figure,
+        "export_figure_letter": args.figure_letter,
+        "figure_width": args.figure_width,
+        "figure_dir": args.figure_dir,
+    }
+
+    writers = {
+        "json": lambda results, out_path, img: results.to_json(
+            out_path,
+            ignore_line_break=ignore_line_break,
+        ),
+        "csv": lambda results, out_path, img: results.to_csv(
+            out_path,
+            ignore_line_break=ignore_line_break,
+        ),
+        "html": lambda results, out_path, img: results.to_html(
+            out_path,
+            ignore_line_break=ignore_line_break,
+            img=img,
+            **figure_kwargs,
+        ),
+        "md": lambda results, out_path, img: results.to_markdown(
+            out_path,
+            ignore_line_break=ignore_line_break,
+            img=img,
+            **figure_kwargs,
+        ),
+    }
+
+    return writers[format]
+
+
+def write_outputs(
+    result_writer, results, ocr, layout, img, prefix, format, image_writer=None
+):
+    """
+    解析結果を書き出す。image_writerが与えられた場合、可視化画像の書き出しは
+    バックグラウンドで行い、そのFutureのリストを返す。
+    """
+
+    futures = []
+    for suffix, vis in [("ocr", ocr), ("layout", layout)]:
+        if vis is None:
+            continue
+
+        out_path = f"{prefix}_{suffix}.jpg"
+        if image_writer is None:
+            save_image(out_path, vis)
+        else:
+            futures.append(image_writer.submit(save_image, out_path, vis))
+
+    out_path = f"{prefix}.{format}"
+    result_writer(results, out_path, img)
+
+    logger.info(f"Output file: {out_path}")
+    return futures
+
+
+def process_single_file(args, analyzer, path, format, image_writer=None):
+    imgs = load_inputs(path)
+    prefix = get_output_prefix(args, path)
+    result_writer = get_result_writer(args, format)
+
+    if image_writer is not None:
+        imgs = prefetch(image_writer, imgs)
+
+    futures = deque()
+    try:
+        for page, img in enumerate(imgs):
+            results, ocr, layout = analyzer(img)
+            futures.extend(
+                write_outputs(
+                    result_writer,
+                    results,
+                    ocr,
+                    layout,
+                    img,
+                    f"{prefix}_p{page+1}",
+                    format,
+                    image_writer,
+                )
             )
-        elif format == "html":
-            results.to_html(
-                out_path,
-                ignore_line_break=args.ignore_line_break,
-                img=img,
-                export_figure=args.figure,
-                export_figure_letter=args.figure_letter,
-                figure_width=args.figure_width,
-                figure_dir=args.figure_dir,
+
+            while len(futures) > MAX_PENDING_WRITES:
+                futures.popleft().result()
+    finally:
+        # 途中で失敗した場合もPDFを明示的に閉じる
+        if hasattr(imgs, "close"):
+            imgs.close()
+
+    for future in futures:
+        future.result()
+
+
+def process_multiple_files(args, analyzer, paths, format, image_writer=None):
+    """
+    ファイルの読み込みと結果の書き出しをスレッドプールで行い、
+    解析器による推論と並行させる。推論自体は単一スレッドで逐次実行する。
+    """
+
+    workers = os.cpu_count() or 1
+    tasks = Queue(maxsize=2 * workers)
+    result_writer = get_result_writer(args, format)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def produce():
+            for path in paths:
+                tasks.put((path, executor.submit(load_inputs, path)))
+            tasks.put(None)
+
+        Thread(target=produce, daemon=True).start()
+
+        failed = []
+        writers = deque()
+        # 同じ名前のファイルは出力先が重なるため、前のファイルの書き出しを待ってから書き出す
+        last_writers = {}
+
+        def wait_writer():
+            path, writer = writers.popleft()
+            try:
+                for future in writer.result():
+                    future.result()
+            except Exception as e:
+                logger.exception(f"Failed to write outputs of {path}: {e}")
+                failed.append((path, e))
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            path, future = task
+            try:
+                start = time.time()
+                logger.info(f"Processing file: {path}")
+                imgs = future.result()
+                prefix = get_output_prefix(args, path)
+                with closing(prefetch(executor, imgs)) as pages:
+                    for page, img in enumerate(pages):
+                        results, ocr, layout = analyzer(img)
+                        out_prefix = f"{prefix}_p{page+1}"
+                        if out_prefix in last_writers:
+                            last_path, last_writer = last_writers[out_prefix]
+                            logger.warning(
+                                f"Outputs of {last_path} are overwritten by {path}"
+                            )
+                            if last_writer.exception() is None:
+                                wait(last_writer.result())
+
+                        writer = executor.submit(
+                            write_outputs,
+                            result_writer,
+                            results,
+                            ocr,
+                            layout,
+                            img,
+                            out_prefix,
+                            format,
+                            image_writer,
+                        )
+                        writers.append((path, writer))
+                        last_writers[out_prefix] = (path, writer)
+
+                        while len(writers) > MAX_PENDING_WRITES:
+                            wait_writer()
+                end = time.time()
+                logger.info(f"Total Processing time: {end-start:.2f} sec")
+            except Exception as e:
+                logger.exception(f"Failed to process {path}: {e}")
+                failed.append((path, e))
+                continue
+
+        while writers:
+            wait_writer()
+
+    return failed
+
+
+def device_worker(args, configs, device, tasks, results, format):
+    # 各プロセスには担当するGPUのみを見せる
+    if device.startswith("cuda:"):
+        os.environ["CUDA_VISIBLE_DEVICES"] = device.split(":")[1]
+        device = "cuda"
+
+    analyzer = DocumentAnalyzer(
+        configs=configs,
+        visualize=args.vis,
+        device=device,
+    )
+
+    with ThreadPoolExecutor(max_workers=4) as image_writer:
+        while True:
+            group = tasks.get()
+            if group is None:
+                break
+
+            for path in group:
+                try:
+                    start = time.time()
+                    logger.info(f"Processing file: {path}")
+                    process_single_file(args, analyzer, path, format, image_writer)
+                    end = time.time()
+                    logger.info(f"Total Processing time: {end-start:.2f} sec")
+                    results.put((path, None))
+                except Exception as e:
+                    logger.exception(f"Failed to process {path}: {e}")
+                    results.put((path, repr(e)))
+
+
+def process_with_multiple_devices(args, configs, devices, paths, format):
+    """
+    デバイスごとにプロセスを起動し、ファイル単位で推論を分散させる。
+    処理に失敗したファイルと、ワーカーの異常終了により処理されなかったファイルを返す。
+    """
+
+    ctx = multiprocessing.get_context("spawn")
+    tasks = ctx.Queue()
+    results = ctx.Queue()
+
+    # 出力先が重なるファイルは同じワーカーで順に処理し、書き出しの競合を避ける
+    groups = {}
+    for path in paths:
+        groups.setdefault(get_output_prefix(args, path), []).append(path)
+
+    for group in groups.values():
+        if len(group) > 1:
+            logger.warning(
+                "Outputs are overwritten in order: "
+                + ", ".join(str(path) for path in group)
             )
-        elif format == "md":
-            results.to_markdown(
-                out_path,
-                ignore_line_break=args.ignore_line_break,
-                img=img,
-                export_figure=args.figure,
-                export_figure_letter=args.figure_letter,
-                figure_width=args.figure_width,
-                figure_dir=args.figure_dir,
+        tasks.put(group)
+
+    for _ in devices:
+        tasks.put(None)
+
+    workers = [
+        ctx.Process(
+            target=device_worker,
+            args=(args, configs, device, tasks, results, format),
+        )
+        for device in devices
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    failed = []
+    remaining = set(paths)
+
+    def receive(timeout):
+        path, error = results.get(timeout=timeout)
+        remaining.discard(path)
+        if error is not None:
+            failed.append((path, error))
+
+    # 結果キューを読み切る前にjoinするとワーカーが終了できないため、先に受信する
+    while len(remaining) > 0 and any(worker.is_alive() for worker in workers):
+        try:
+            receive(timeout=1)
+        except Empty:
+            continue
+
+    while len(remaining) > 0:
+        try:
+            receive(timeout=1)
+        except Empty:
+            break
+
+    for device, worker in zip(devices, workers):
+        worker.join()
+        if worker.exitcode != 0:
+            logger.error(
+                f"Worker process for {device} exited with code {worker.exitcode}"
             )
 
-        logger.info(f"Output file: {out_path}")
+    # ワーカーが全て異常終了した場合、未処理のタスクがパイプに残り、
+    # 終了時にキューのフィーダースレッドを待ち続けてしまうため破棄する
+    tasks.cancel_join_thread()
+
+    for path in remaining:
+        failed.append((path, "worker process exited before processing the file"))
+
+    return failed
+
+
+def log_failed_files(failed):
+    if len(failed) > 0:
+        logger.warning(
+            f"Failed to process {len(failed)} file(s): "
+            + ", ".join(str(path) for path, _ in failed)
+        )
 
 
 def main():
@@ -109,7 +398,7 @@ def main():
         "--device",
         type=str,
         default="cuda",
-        help="device to use",
+        help="device to use. multiple devices are separated by comma (e.g. cuda:0,cuda:1)",
     )
     parser.add_argument(
         "--td_cfg",
@@ -135,6 +424,23 @@ def main():
         default=None,
         help="path of table structure recognizer config file",
     )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="if set, compile the models with torch.compile (CUDA only)",
+    )
+    parser.add_argument(
+        "--fp16",
+        action="store_true",
+        help="if set, run the table structure recognizer in FP16 (CUDA only)",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="torch",
+        choices=SUPPORT_BACKEND,
+        help="inference backend of the detection models (torch or ort or trt)",
+    )
     parser.add_argument(
         "--ignore_line_break",
         action="store_true",
@@ -182,48 +488,66 @@ def main():
         "ocr": {
             "text_detector": {
                 "path_cfg": args.td_cfg,
+                "use_compile": args.compile,
+                "backend": args.backend,
             },
             "text_recognizer": {
                 "path_cfg": args.tr_cfg,
+                "use_compile": args.compile,
             },
         },
         "layout_analyzer": {
             "layout_parser": {
                 "path_cfg": args.lp_cfg,
+                "use_compile": args.compile,
+                "backend": args.backend,
             },
             "table_structure_recognizer": {
                 "path_cfg": args.tsr_cfg,
+                "use_compile": args.compile,
+                "use_half": args.fp16,
+                "backend": args.backend,
             },
         },
     }
 
-    analyzer = DocumentAnalyzer(
-        configs=configs,
-        visualize=args.vis,
-        device=args.device,
-    )
-
     os.makedirs(args.outdir, exist_ok=True)
     logger.info(f"Output directory: {args.outdir}")
 
+    devices = [device.strip() for device in args.device.split(",")]
     if path.is_dir():
         all_files = [f for f in path.rglob("*") if f.is_file()]
-        for f in all_files:
-            try:
-                start = time.time()
-                file_path = Path(f)
-                logger.info(f"Processing file: {file_path}")
-                process_single_file(args, analyzer, file_path, format)
-                end = time.time()
-                logger.info(f"Total Processing time: {end-start:.2f} sec")
-            except Exception:
-                continue
     else:
-        start = time.time()
-        logger.info(f"Processing file: {path}")
-        process_single_file(args, analyzer, path, format)
-        end = time.time()
-        logger.info(f"Total Processing time: {end-start:.2f} sec")
+        all_files = [path]
+
+    if len(devices) > 1 and len(all_files) > 1:
+        failed = process_with_multiple_devices(
+            args, configs, devices, all_files, format
+        )
+        log_failed_files(failed)
+        return
+
+    if len(devices) > 1:
+        logger.info(f"Only one file is given. Use {devices[0]} only.")
+
+    analyzer = DocumentAnalyzer(
+        configs=configs,
+        visualize=args.vis,
+        device=devices[0],
+    )
+
+    with ThreadPoolExecutor(max_workers=4) as image_writer:
+        if path.is_dir():
+            failed = process_multiple_files(
+                args, analyzer, all_files, format, image_writer
+            )
+            log_failed_files(failed)
+        else:
+            start = time.time()
+            logger.info(f"Processing file: {path}")
+            process_single_file(args, analyzer, path, format, image_writer)
+            end = time.time()
+            logger.info(f"Total Processing time: {end-start:.2f} sec")
 
 
 if __name__ == "__main__":
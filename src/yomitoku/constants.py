@@ -1,6 +1,8 @@
 import os
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ONNX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "yomitoku", "onnx")
+SUPPORT_BACKEND = ["torch", "ort", "trt"]
 SUPPORT_OUTPUT_FORMAT = ["json", "csv", "html", "markdown", "md"]
 SUPPORT_INPUT_FORMAT = ["jpg", "jpeg", "png", "bmp", "tiff", "tif", "pdf"]
 MIN_IMAGE_SIZE = 32
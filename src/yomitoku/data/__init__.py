@@ -1,3 +1,3 @@
-from .functions import load_image, load_pdf
+from .functions import iter_pdf, load_image, load_pdf
 
-__all__ = ["load_image", "load_pdf"]
+__all__ = ["iter_pdf", "load_image", "load_pdf"]
@@ -1,4 +1,6 @@
 from pathlib import Path
+from threading import RLock
+from typing import Iterator
 
 import cv2
 import numpy as np
@@ -14,6 +16,8 @@ from ..utils.logger import set_logger
 
 logger = set_logger(__name__)
 
+PDFIUM_LOCK = RLock()
+
 
 def load_image(image_path: str) -> np.ndarray:
     """
@@ -60,15 +64,15 @@ def load_image(image_path: str) -> np.ndarray:
     return img
 
 
-def load_pdf(pdf_path: str, dpi=200) -> list[np.ndarray]:
+def iter_pdf(pdf_path: str, dpi=200) -> Iterator[np.ndarray]:
     """
-    Open a PDF file.
+    Open a PDF file and render its pages lazily.
 
     Args:
         pdf_path (str): path to the PDF file
 
     Returns:
-        list[np.ndarray]: list of image data(BGR)
+        Iterator[np.ndarray]: iterator of image data(BGR), one per page
     """
 
     pdf_path = Path(pdf_path)
@@ -87,19 +91,43 @@ def load_pdf(pdf_path: str, dpi=200) -> list[np.ndarray]:
         )
 
     try:
-        doc = pypdfium2.PdfDocument(pdf_path)
-        renderer = doc.render(
-            pypdfium2.PdfBitmap.to_pil,
-            scale=dpi / 72,
-        )
-        images = list(renderer)
-        images = [np.array(image.convert("RGB"))[:, :, ::-1] for image in images]
+        with PDFIUM_LOCK:
+            doc = pypdfium2.PdfDocument(pdf_path)
+    except Exception as e:
+        raise ValueError(f"Failed to open the PDF file: {pdf_path}") from e
+
+    return _render_pdf_pages(doc, pdf_path, dpi)
+
 
-        doc.close()
+def _render_pdf_pages(doc, pdf_path, dpi):
+    try:
+        for i in range(len(doc)):
+            # PDFiumはスレッドセーフではないため、描画は排他的に行う
+            with PDFIUM_LOCK:
+                page = doc[i]
+                image = page.render(scale=dpi / 72).to_pil()
+                page.close()
+
+            yield np.array(image.convert("RGB"))[:, :, ::-1]
     except Exception as e:
         raise ValueError(f"Failed to open the PDF file: {pdf_path}") from e
+    finally:
+        with PDFIUM_LOCK:
+            doc.close()
+
+
+def load_pdf(pdf_path: str, dpi=200) -> list[np.ndarray]:
+    """
+    Open a PDF file.
+
+    Args:
+        pdf_path (str): path to the PDF file
+
+    Returns:
+        list[np.ndarray]: list of image data(BGR)
+    """
 
-    return images
+    return list(iter_pdf(pdf_path, dpi))
 
 
 def resize_shortest_edge(
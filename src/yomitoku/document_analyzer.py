@@ -184,6 +184,10 @@ class DocumentAnalyzer:
         self.layout = LayoutAnalyzer(configs=default_configs["layout_analyzer"])
         self.visualize = visualize
 
+        # CUDAグラフはスレッドごとに保持されるため、各解析器を常に同じスレッドで実行する
+        self.ocr_executor = ThreadPoolExecutor(max_workers=1)
+        self.layout_executor = ThreadPoolExecutor(max_workers=1)
+
     def aggregate(self, ocr_res, layout_res):
         paragraphs = []
         check_list = [False] * len(ocr_res.words)
@@ -283,17 +287,16 @@ class DocumentAnalyzer:
         return outputs
 
     async def run(self, img):
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            loop = asyncio.get_running_loop()
-            tasks = [
-                loop.run_in_executor(executor, self.ocr, img),
-                loop.run_in_executor(executor, self.layout, img),
-            ]
+        loop = asyncio.get_running_loop()
+        tasks = [
+            loop.run_in_executor(self.ocr_executor, self.ocr, img),
+            loop.run_in_executor(self.layout_executor, self.layout, img),
+        ]
 
-            results = await asyncio.gather(*tasks)
+        results = await asyncio.gather(*tasks)
 
-            results_ocr, ocr = results[0]
-            results_layout, layout = results[1]
+        results_ocr, ocr = results[0]
+        results_layout, layout = results[1]
 
         outputs = self.aggregate(results_ocr, results_layout)
         results = DocumentAnalyzerSchema(**outputs)
@@ -181,8 +181,8 @@ def export_html(
     html_string = "".join([element["html"] for element in elements])
     html_string = add_html_tag(html_string)
 
+    # 文字列を経由せず、UTF-8のバイト列として直接書き出す
     parsed_html = html.fromstring(html_string)
-    formatted_html = etree.tostring(parsed_html, pretty_print=True, encoding="unicode")
-
-    with open(out_path, "w", encoding="utf-8") as f:
+    formatted_html = etree.tostring(parsed_html, pretty_print=True, encoding="utf-8")
+    with open(out_path, "wb") as f:
         f.write(formatted_html)
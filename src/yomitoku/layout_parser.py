@@ -91,6 +91,8 @@ class LayoutParser(BaseModule):
         device="cuda",
         visualize=False,
         from_pretrained=True,
+        use_compile=False,
+        backend="torch",
     ):
         super().__init__()
         self.load_model(model_name, path_cfg, from_pretrained)
@@ -100,6 +102,16 @@ class LayoutParser(BaseModule):
         self.model.eval()
         self.model.to(self.device)
 
+        self.setup_backend(
+            backend,
+            input_shape=(1, 3, *self._cfg.data.img_size),
+            output_names=["pred_logits", "pred_boxes"],
+            dynamic_axes={0: "N"},
+        )
+
+        if use_compile:
+            self.compile()
+
         self.postprocessor = RTDETRPostProcessor(
             num_classes=self._cfg.RTDETRTransformerv2.num_classes,
             num_top_queries=self._cfg.RTDETRTransformerv2.num_queries,
@@ -114,9 +126,7 @@ class LayoutParser(BaseModule):
 
         self.thresh_score = self._cfg.thresh_score
 
-        self.label_mapper = {
-            id: category for id, category in enumerate(self._cfg.category)
-        }
+        self.labels_list = tuple(self._cfg.category)
 
         self.role = self._cfg.role
 
@@ -141,12 +151,12 @@ class LayoutParser(BaseModule):
 
         category_elements = {
             category: []
-            for category in self.label_mapper.values()
+            for category in self.labels_list
             if category not in self.role
         }
 
         for box, score, label in zip(boxes, scores, labels):
-            category = self.label_mapper[label.item()]
+            category = self.labels_list[label]
 
             role = None
             if category in self.role:
@@ -176,7 +186,7 @@ class LayoutParser(BaseModule):
         img_tensor = self.preprocess(img)
 
         with torch.inference_mode():
-            preds = self.model(img_tensor)
+            preds = self.infer(img_tensor)
         results = self.postprocess(preds, (ori_h, ori_w))
 
         vis = None
@@ -7,7 +7,6 @@ class ScaleChannelAttention(nn.Module):
     def __init__(self, in_planes, out_planes, num_features, init_weight=True):
         super(ScaleChannelAttention, self).__init__()
         self.avgpool = nn.AdaptiveAvgPool2d(1)
-        print(self.avgpool)
         self.fc1 = nn.Conv2d(in_planes, out_planes, 1, bias=False)
         self.bn = nn.BatchNorm2d(out_planes)
         self.fc2 = nn.Conv2d(out_planes, num_features, 1, bias=False)
@@ -381,10 +381,10 @@ class HybridEncoder(nn.Module):
                 if self.training or self.eval_spatial_size is None:
                     pos_embed = self.build_2d_sincos_position_embedding(
                         w, h, self.hidden_dim, self.pe_temperature
-                    ).to(src_flatten.device)
+                    ).to(device=src_flatten.device, dtype=src_flatten.dtype)
                 else:
                     pos_embed = getattr(self, f"pos_embed{enc_ind}", None).to(
-                        src_flatten.device
+                        device=src_flatten.device, dtype=src_flatten.dtype
                     )
 
                 memory: torch.Tensor = self.encoder[i](
@@ -106,17 +106,15 @@ class RTDETRPostProcessor(nn.Module):
                 .reshape(labels.shape)
             )
 
-        results = []
-        for lab, box, sco in zip(labels, boxes, scores):
-            lab = lab[sco > threshold]
-            box = box[sco > threshold]
-            sco = sco[sco > threshold]
-
-            lab = lab.cpu().numpy()
-            box = box.cpu().numpy()
-            sco = sco.cpu().numpy()
+        # transfer the whole batch to host once instead of per image
+        masks = (scores > threshold).cpu().numpy()
+        labels = labels.cpu().numpy()
+        boxes = boxes.cpu().numpy()
+        scores = scores.cpu().numpy()
 
-            result = dict(labels=lab, boxes=box, scores=sco)
+        results = []
+        for lab, box, sco, mask in zip(labels, boxes, scores, masks):
+            result = dict(labels=lab[mask], boxes=box[mask], scores=sco[mask])
             results.append(result)
 
         return results
@@ -1,9 +1,8 @@
 from typing import List, Union
 
-import cv2
+import numpy as np
 import torch
-import torchvision.transforms as T
-from PIL import Image
+import torch.nn.functional as F
 from pydantic import conlist
 
 from .base import BaseModelCatalog, BaseModule, BaseSchema
@@ -11,9 +10,11 @@ from .configs import TableStructureRecognizerRTDETRv2Config
 from .layout_parser import filter_contained_rectangles_within_category
 from .models import RTDETRv2
 from .postprocessor import RTDETRPostProcessor
-from .utils.misc import calc_intersection, filter_by_flag, is_contained
+from .utils.logger import set_logger
 from .utils.visualizer import table_visualizer
 
+logger = set_logger(__name__, "INFO")
+
 
 class TableStructureRecognizerModelCatalog(BaseModelCatalog):
     def __init__(self):
@@ -39,64 +40,84 @@ class TableStructureRecognizerSchema(BaseSchema):
 
 
 def extract_cells(row_boxes, col_boxes):
-    cells = []
-    for i, row_box in enumerate(row_boxes):
-        for j, col_box in enumerate(col_boxes):
-            intersection = calc_intersection(row_box, col_box)
-            if intersection is None:
-                continue
-
-            cells.append(
-                {
-                    "col": j + 1,
-                    "row": i + 1,
-                    "col_span": 1,
-                    "row_span": 1,
-                    "box": intersection,
-                    "contents": None,
-                }
-            )
-
-    return cells
-
-
-def filter_contained_cells_within_spancell(cells, span_boxes):
-    check_list = [True] * len(cells)
-    child_boxes = [[] for _ in range(len(span_boxes))]
-    for i, span_box in enumerate(span_boxes):
-        for j, sub_cell in enumerate(cells):
-            if is_contained(span_box, sub_cell["box"]):
-                check_list[j] = False
-                child_boxes[i].append(sub_cell)
-
-    cells = filter_by_flag(cells, check_list)
-
-    for i, span_box in enumerate(span_boxes):
-        child_box = child_boxes[i]
+    """行と列の交差領域をセルとして抽出し、要素ごとの配列として返す"""
+
+    row_boxes = np.asarray(row_boxes, dtype=int).reshape(-1, 4)
+    col_boxes = np.asarray(col_boxes, dtype=int).reshape(-1, 4)
+
+    # 全ての行と列の組み合わせについて交差領域を一括で求める
+    x1 = np.maximum(row_boxes[:, None, 0], col_boxes[None, :, 0])
+    y1 = np.maximum(row_boxes[:, None, 1], col_boxes[None, :, 1])
+    x2 = np.minimum(row_boxes[:, None, 2], col_boxes[None, :, 2])
+    y2 = np.minimum(row_boxes[:, None, 3], col_boxes[None, :, 3])
+    rows, cols = ((x2 > x1) & (y2 > y1)).nonzero()
+
+    return {
+        "row": rows + 1,
+        "col": cols + 1,
+        "box": np.stack(
+            [
+                x1[rows, cols],
+                y1[rows, cols],
+                x2[rows, cols],
+                y2[rows, cols],
+            ],
+            axis=1,
+        ),
+    }
+
+
+def filter_contained_cells_within_spancell(cells, span_boxes, threshold=0.8):
+    """スパンセルに内包されるセルを統合し、セルのリストを返す"""
+
+    span_boxes = np.asarray(span_boxes, dtype=int).reshape(-1, 4)
+    boxes = cells["box"]
+
+    # 各セルについて、スパンセルとの重なり面積がセル面積に占める割合を一括で求める
+    x1 = np.maximum(span_boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(span_boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(span_boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(span_boxes[:, None, 3], boxes[None, :, 3])
+    overlap_area = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    contained = overlap_area / area[None, :] > threshold
+
+    outputs = []
+    for i in (~contained.any(axis=0)).nonzero()[0]:
+        outputs.append(
+            {
+                "col": int(cells["col"][i]),
+                "row": int(cells["row"][i]),
+                "col_span": 1,
+                "row_span": 1,
+                "box": boxes[i].tolist(),
+                "contents": None,
+            }
+        )
 
-        if len(child_box) == 0:
+    for span_box, child_mask in zip(span_boxes, contained):
+        if not child_mask.any():
             continue
 
-        row = min([box["row"] for box in child_box])
-        col = min([box["col"] for box in child_box])
-        row_span = max([box["row"] for box in child_box]) - row + 1
-        col_span = max([box["col"] for box in child_box]) - col + 1
+        child_rows = cells["row"][child_mask]
+        child_cols = cells["col"][child_mask]
 
-        span_box = list(map(int, span_box))
+        row = int(child_rows.min())
+        col = int(child_cols.min())
 
-        cells.append(
+        outputs.append(
             {
                 "col": col,
                 "row": row,
-                "col_span": col_span,
-                "row_span": row_span,
-                "box": span_box,
+                "col_span": int(child_cols.max()) - col + 1,
+                "row_span": int(child_rows.max()) - row + 1,
+                "box": span_box.tolist(),
                 "contents": None,
             }
         )
 
-    cells = sorted(cells, key=lambda x: (x["row"], x["col"]))
-    return cells
+    outputs = sorted(outputs, key=lambda x: (x["row"], x["col"]))
+    return outputs
 
 
 class TableStructureRecognizer(BaseModule):
@@ -109,6 +130,9 @@ class TableStructureRecognizer(BaseModule):
         device="cuda",
         visualize=False,
         from_pretrained=True,
+        use_compile=False,
+        use_half=False,
+        backend="torch",
     ):
         super().__init__()
         self.load_model(
@@ -122,69 +146,132 @@ class TableStructureRecognizer(BaseModule):
         self.model.eval()
         self.model.to(self.device)
 
+        self.setup_backend(
+            backend,
+            input_shape=(1, 3, *self._cfg.data.img_size),
+            output_names=["pred_logits", "pred_boxes"],
+            dynamic_axes={0: "N"},
+        )
+
+        # FP16はautocastで適用し、重みはFP32のまま保持する
+        self.use_half = False
+        if use_half:
+            if self.device.type != "cuda":
+                logger.warning("FP16 inference is only supported on CUDA. Use FP32.")
+            elif self.backend != "torch":
+                logger.warning("FP16 inference is only supported on torch backend.")
+            else:
+                self.use_half = True
+
+        if use_compile:
+            self.compile()
+
         self.postprocessor = RTDETRPostProcessor(
             num_classes=self._cfg.RTDETRTransformerv2.num_classes,
             num_top_queries=self._cfg.RTDETRTransformerv2.num_queries,
         )
 
-        self.transforms = T.Compose(
-            [
-                T.Resize(self._cfg.data.img_size),
-                T.ToTensor(),
-            ]
-        )
-
         self.thresh_score = self._cfg.thresh_score
 
-        self.label_mapper = {
-            id: category for id, category in enumerate(self._cfg.category)
-        }
+        self.labels_list = tuple(self._cfg.category)
+
+        self._staging = None
+        self._staging_event = None
+
+    def to_device(self, img):
+        if self.device.type != "cuda":
+            return torch.from_numpy(np.ascontiguousarray(img))
+
+        # ページ間で固定メモリのバッファを使い回し、確保のコストを抑える
+        if self._staging is None or self._staging.numel() < img.size:
+            self._staging = torch.empty(img.size, dtype=torch.uint8, pin_memory=True)
+        elif self._staging_event is not None:
+            self._staging_event.synchronize()
+
+        staging = self._staging[: img.size].view(img.shape)
+        np.copyto(staging.numpy(), img)
+        img_tensor = staging.to(self.device, non_blocking=True)
+
+        self._staging_event = torch.cuda.Event()
+        self._staging_event.record()
+
+        return img_tensor
 
     def preprocess(self, img, boxes):
-        cv_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        if len(boxes) == 0:
+            return None, []
+
+        # 画像全体を一度だけデバイスへ転送し、切り出しとリサイズはテンソル上で行う
+        img_tensor = self.to_device(img)
+        img_tensor = img_tensor.permute(2, 0, 1).flip(0)  # HWC(BGR) -> CHW(RGB)
 
         table_imgs = []
+        img_tensors = []
         for box in boxes:
             x1, y1, x2, y2 = map(int, box)
-            table_img = cv_img[y1:y2, x1:x2, :]
-            th, hw = table_img.shape[:2]
-            table_img = Image.fromarray(table_img)
-            img_tensor = self.transforms(table_img)[None].to(self.device)
+            table_img = img_tensor[:, y1:y2, x1:x2]
+            th, hw = table_img.shape[1:]
+            table_img = F.interpolate(
+                table_img[None].float(),
+                size=tuple(self._cfg.data.img_size),
+                mode="bilinear",
+                align_corners=False,
+                antialias=True,
+            )
+            img_tensors.append(table_img)
             table_imgs.append(
                 {
-                    "tensor": img_tensor,
                     "size": (th, hw),
                     "offset": (x1, y1),
                 }
             )
-        return table_imgs
 
-    def postprocess(self, preds, data):
-        h, w = data["size"]
-        orig_size = torch.tensor([w, h])[None].to(self.device)
+        # CUDAグラフの再キャプチャを抑えるため、バッチサイズを2のべき乗に揃える
+        if self.use_compile:
+            n_pad = (1 << (len(img_tensors) - 1).bit_length()) - len(img_tensors)
+            if n_pad > 0:
+                pad = torch.zeros_like(img_tensors[0]).repeat(n_pad, 1, 1, 1)
+                img_tensors.append(pad)
+
+        img_tensor = torch.cat(img_tensors, dim=0).div_(255.0)
+
+        return img_tensor, table_imgs
+
+    def postprocess(self, preds, table_imgs):
+        # 座標のスケーリングはFP32で行う
+        preds = {key: value[: len(table_imgs)].float() for key, value in preds.items()}
+        orig_size = torch.tensor(
+            [[data["size"][1], data["size"][0]] for data in table_imgs]
+        ).to(self.device)
         outputs = self.postprocessor(preds, orig_size, self.thresh_score)
 
-        preds = outputs[0]
+        results = []
+        for pred, data in zip(outputs, table_imgs):
+            results.append(self.build_table(pred, data))
+
+        return results
+
+    def build_table(self, preds, data):
         scores = preds["scores"]
         boxes = preds["boxes"]
         labels = preds["labels"]
 
-        category_elements = {category: [] for category in self.label_mapper.values()}
-        for box, score, label in zip(boxes, scores, labels):
-            category = self.label_mapper[label.item()]
-            box = box.astype(int).tolist()
-
-            box[0] += data["offset"][0]
-            box[1] += data["offset"][1]
-            box[2] += data["offset"][0]
-            box[3] += data["offset"][1]
+        # テーブル画像上の座標を元画像上の座標へ一括で変換する
+        boxes = boxes.astype(int)
+        boxes[:, [0, 2]] += data["offset"][0]
+        boxes[:, [1, 3]] += data["offset"][1]
 
-            category_elements[category].append(
+        category_elements = {category: [] for category in self.labels_list}
+        for label in np.unique(labels):
+            mask = labels == label
+            category = self.labels_list[label]
+            category_elements[category] = [
                 {
                     "box": box,
-                    "score": float(score),
+                    "score": score,
                 }
-            )
+                for box, score in zip(boxes[mask].tolist(), scores[mask].tolist())
+            ]
 
         category_elements = filter_contained_rectangles_within_category(
             category_elements
@@ -210,12 +297,16 @@ class TableStructureRecognizer(BaseModule):
         return results
 
     def extract_cell_elements(self, elements):
-        row_boxes = [element["box"] for element in elements["row"]]
-        col_boxes = [element["box"] for element in elements["col"]]
+        row_boxes = np.asarray(
+            [element["box"] for element in elements["row"]], dtype=int
+        ).reshape(-1, 4)
+        col_boxes = np.asarray(
+            [element["box"] for element in elements["col"]], dtype=int
+        ).reshape(-1, 4)
         span_boxes = [element["box"] for element in elements["span"]]
 
-        row_boxes = sorted(row_boxes, key=lambda x: x[1])
-        col_boxes = sorted(col_boxes, key=lambda x: x[0])
+        row_boxes = row_boxes[np.argsort(row_boxes[:, 1], kind="stable")]
+        col_boxes = col_boxes[np.argsort(col_boxes[:, 0], kind="stable")]
 
         cells = extract_cells(row_boxes, col_boxes)
         cells = filter_contained_cells_within_spancell(cells, span_boxes)
@@ -223,13 +314,15 @@ class TableStructureRecognizer(BaseModule):
         return cells, len(row_boxes), len(col_boxes)
 
     def __call__(self, img, table_boxes, vis=None):
-        img_tensors = self.preprocess(img, table_boxes)
+        img_tensor, table_imgs = self.preprocess(img, table_boxes)
+
         outputs = []
-        for data in img_tensors:
-            with torch.inference_mode():
-                pred = self.model(data["tensor"])
-            table = self.postprocess(pred, data)
-            outputs.append(table)
+        if img_tensor is not None:
+            with torch.inference_mode(), torch.autocast(
+                "cuda", dtype=torch.float16, enabled=self.use_half
+            ):
+                preds = self.infer(img_tensor)
+            outputs = self.postprocess(preds, table_imgs)
 
         if vis is None and self.visualize:
             vis = img.copy()
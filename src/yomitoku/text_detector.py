@@ -43,6 +43,8 @@ class TextDetector(BaseModule):
         device="cuda",
         visualize=False,
         from_pretrained=True,
+        use_compile=False,
+        backend="torch",
     ):
         super().__init__()
         self.load_model(
@@ -57,6 +59,22 @@ class TextDetector(BaseModule):
         self.model.eval()
         self.model.to(self.device)
 
+        self.setup_backend(
+            backend,
+            input_shape=(
+                1,
+                3,
+                self._cfg.data.shortest_size,
+                self._cfg.data.shortest_size,
+            ),
+            output_names=["binary"],
+            dynamic_axes={0: "N", 2: "H", 3: "W"},
+        )
+
+        # 入力サイズが毎回変わるため、CUDAグラフは使わず動的形状でコンパイルする
+        if use_compile:
+            self.compile(mode="default", dynamic=True)
+
         self.post_processor = DBnetPostProcessor(**self._cfg.post_process)
 
     def preprocess(self, img):
@@ -83,7 +101,7 @@ class TextDetector(BaseModule):
         tensor = self.preprocess(img)
         tensor = tensor.to(self.device)
         with torch.inference_mode():
-            preds = self.model(tensor)
+            preds = self.infer(tensor)
 
         quads, scores = self.postprocess(preds, (ori_h, ori_w))
         outputs = {"points": quads, "scores": scores}
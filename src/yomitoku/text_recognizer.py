@@ -43,6 +43,7 @@ class TextRecognizer(BaseModule):
         device="cuda",
         visualize=False,
         from_pretrained=True,
+        use_compile=False,
     ):
         super().__init__()
         self.load_model(
@@ -58,6 +59,10 @@ class TextRecognizer(BaseModule):
         self.model.eval()
         self.model.to(self.device)
 
+        # 入力サイズが毎回変わるため、CUDAグラフは使わず動的形状でコンパイルする
+        if use_compile:
+            self.compile(mode="default", dynamic=True)
+
         self.visualize = visualize
 
     def preprocess(self, img, polygons):
@@ -1,6 +1,7 @@
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import pytest
+import torch
 
 from yomitoku.base import (
     BaseModelCatalog,
@@ -9,6 +10,7 @@ from yomitoku.base import (
     load_yaml_config,
 )
 from yomitoku.configs import LayoutParserRTDETRv2Config
+from yomitoku.layout_parser import LayoutParser
 from yomitoku.models import RTDETRv2
 
 
@@ -69,6 +71,50 @@ def test_base_model(tmp_path):
     module.catalog()
 
 
+def test_base_backend():
+    module = TestModule()
+
+    with pytest.raises(ValueError):
+        module.setup_backend(
+            "dummy",
+            input_shape=(1, 3, 640, 640),
+            output_names=["pred_logits", "pred_boxes"],
+            dynamic_axes={0: "N"},
+        )
+
+    module.setup_backend(
+        "torch",
+        input_shape=(1, 3, 640, 640),
+        output_names=["pred_logits", "pred_boxes"],
+        dynamic_axes={0: "N"},
+    )
+    assert module.backend == "torch"
+    assert module.session is None
+
+    module.model = MagicMock(return_value={"pred_logits": 0})
+    assert module.infer("tensor") == {"pred_logits": 0}
+    module.model.assert_called_once_with("tensor")
+
+
+def test_base_backend_ort(monkeypatch, tmp_path):
+    pytest.importorskip("onnxruntime")
+    monkeypatch.setattr("yomitoku.base.ONNX_CACHE_DIR", str(tmp_path))
+
+    parser = LayoutParser(device="cpu", from_pretrained=False, backend="ort")
+    assert parser.session is not None
+
+    tensor = torch.rand(2, 3, *parser._cfg.data.img_size)
+    preds = parser.infer(tensor)
+
+    assert preds["pred_logits"].shape[0] == 2
+    assert preds["pred_boxes"].shape[0] == 2
+
+    with torch.inference_mode():
+        expected = parser.model(tensor)
+    assert preds["pred_logits"].shape == expected["pred_logits"].shape
+    assert preds["pred_boxes"].shape == expected["pred_boxes"].shape
+
+
 def test_base_catalog():
     catalog = TestModelCatalog()
     assert catalog.list_model() == ["test"]
@@ -1,6 +1,11 @@
+import argparse
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from threading import Lock
 
+import numpy as np
 import pytest
 
 from yomitoku.cli import main
@@ -69,6 +74,22 @@ def test_run_invalid_format(monkeypatch, tmp_path):
         main.main()
 
 
+def test_run_invalid_backend(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        "sys.argv",
+        [
+            "main.py",
+            "tests/data/test.pdf",
+            "-o",
+            str(tmp_path),
+            "--backend",
+            "invalid",
+        ],
+    )
+    with pytest.raises(SystemExit):
+        main.main()
+
+
 def test_run_png_markdown(monkeypatch, tmp_path):
     path_img = "tests/data/test.png"
     monkeypatch.setattr(
@@ -197,3 +218,105 @@ def test_run_dir_json(monkeypatch, tmp_path):
     filename = "test"
     out_path = os.path.join(str(tmp_path), f"{dirname}_{filename}_p1.json")
     assert os.path.exists(out_path)
+
+
+def test_run_dir_multiple_devices(monkeypatch, tmp_path):
+    path_img = "tests/data"
+    monkeypatch.setattr(
+        "sys.argv",
+        [
+            "main.py",
+            path_img,
+            "-o",
+            str(tmp_path),
+            "-f",
+            "json",
+            "-d",
+            "cpu,cpu",
+        ],
+    )
+    main.main()
+    path = Path(path_img)
+    dirname = path.name
+    filename = "test"
+    out_path = os.path.join(str(tmp_path), f"{dirname}_{filename}_p1.json")
+    assert os.path.exists(out_path)
+
+
+def test_run_dir_multiple_devices_worker_failure(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        "sys.argv",
+        [
+            "main.py",
+            "tests/data",
+            "-o",
+            str(tmp_path),
+            "-d",
+            "cpu,cpu",
+            "--tr_cfg",
+            "tests/yaml/dummy.yaml",
+        ],
+    )
+    failed = []
+    monkeypatch.setattr(main, "log_failed_files", failed.extend)
+
+    # 全てのワーカーが初期化に失敗しても、未処理のファイルを失敗として返す
+    main.main()
+
+    files = [f for f in Path("tests/data").rglob("*") if f.is_file()]
+    assert sorted(str(path) for path, _ in failed) == sorted(str(f) for f in files)
+
+
+def test_prefetch():
+    closed = []
+
+    def pages():
+        try:
+            for i in range(3):
+                yield i
+        finally:
+            closed.append(True)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert list(main.prefetch(executor, pages())) == [0, 1, 2]
+        assert closed == [True]
+
+        # 途中で閉じた場合も元のイテレータが閉じられる
+        it = main.prefetch(executor, pages())
+        assert next(it) == 0
+        it.close()
+        assert closed == [True, True]
+
+
+def test_process_multiple_files_same_prefix(monkeypatch, tmp_path):
+    lock = Lock()
+    active = set()
+    overlaps = []
+    written = []
+
+    def result_writer(results, out_path, img):
+        with lock:
+            if out_path in active:
+                overlaps.append(out_path)
+            active.add(out_path)
+        time.sleep(0.05)
+        with lock:
+            active.discard(out_path)
+            written.append(out_path)
+
+    monkeypatch.setattr(
+        main, "load_inputs", lambda path: [np.zeros((8, 8, 3), dtype=np.uint8)]
+    )
+    monkeypatch.setattr(main, "get_result_writer", lambda args, format: result_writer)
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+
+    # 拡張子のみが異なるファイルは同じ出力先になる
+    args = argparse.Namespace(outdir=str(tmp_path))
+    paths = [Path(f"tests/data/test.{ext}") for ext in ["jpg", "png", "bmp", "tiff"]]
+    failed = main.process_multiple_files(
+        args, lambda img: ({}, None, None), paths, "json"
+    )
+
+    assert failed == []
+    assert overlaps == []
+    assert len(written) == len(paths)
@@ -3,6 +3,7 @@ import pytest
 
 from yomitoku.data.functions import (
     array_to_tensor,
+    iter_pdf,
     load_image,
     load_pdf,
     resize_shortest_edge,
@@ -78,6 +79,28 @@ def test_load_pdf():
         assert image.dtype == "uint8"
 
 
+def test_iter_pdf():
+    with pytest.raises(FileNotFoundError):
+        iter_pdf("dummy.pdf")
+
+    with pytest.raises(ValueError):
+        iter_pdf("tests/data/invalid.pdf")
+
+    with pytest.raises(ValueError):
+        iter_pdf("tests/data/test.jpg")
+
+    images = iter_pdf("tests/data/test.pdf")
+    assert not isinstance(images, list)
+
+    pages = 0
+    for image in images:
+        assert image.shape[2] == 3
+        assert image.dtype == "uint8"
+        pages += 1
+
+    assert pages == 2
+
+
 def test_resize_shortest_edge():
     img = np.zeros((1920, 1920, 3), dtype=np.uint8)
     resized = resize_shortest_edge(img, 1280, 1500)
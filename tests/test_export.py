@@ -11,6 +11,7 @@ from yomitoku.document_analyzer import (
 from yomitoku.export.export_csv import paragraph_to_csv, table_to_csv
 from yomitoku.export.export_html import (
     convert_text_to_html,
+    export_html,
     paragraph_to_html,
     table_to_html,
 )
@@ -111,6 +112,30 @@ def test_paragraph_to_html():
     assert paragraph_to_html(paragraph, ignore_line_break=True)["html"] == expected
 
 
+def test_export_html(tmp_path):
+    paragraph = {
+        "direction": "horizontal",
+        "box": [0, 0, 10, 10],
+        "contents": "これはテストです。\n",
+        "order": 0,
+        "role": None,
+    }
+    paragraph = ParagraphSchema(**paragraph)
+    inputs = DocumentAnalyzerSchema(
+        paragraphs=[paragraph], tables=[], figures=[], words=[]
+    )
+
+    out_path = tmp_path / "test.html"
+    export_html(inputs, out_path)
+
+    with open(out_path, "rb") as f:
+        data = f.read()
+
+    # DOCTYPEやXML宣言を付けずに<html>から書き出す
+    assert data.startswith(b"<html>\n  <body>")
+    assert "これはテストです。" in data.decode("utf-8")
+
+
 def test_escape_markdown_special_chars():
     texts = [
         {
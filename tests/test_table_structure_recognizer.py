@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+import torch
+
+from yomitoku.data.functions import load_image
+from yomitoku.table_structure_recognizer import (
+    TableStructureRecognizer,
+    extract_cells,
+    filter_contained_cells_within_spancell,
+)
+
+
+def test_extract_cells():
+    row_boxes = [[0, 0, 100, 10], [0, 10, 100, 20]]
+    col_boxes = [[0, 0, 50, 20], [50, 0, 100, 20], [200, 0, 300, 20]]
+
+    cells = extract_cells(row_boxes, col_boxes)
+
+    assert cells["row"].tolist() == [1, 1, 2, 2]
+    assert cells["col"].tolist() == [1, 2, 1, 2]
+    assert cells["box"].tolist() == [
+        [0, 0, 50, 10],
+        [50, 0, 100, 10],
+        [0, 10, 50, 20],
+        [50, 10, 100, 20],
+    ]
+
+
+def test_extract_cells_empty():
+    assert extract_cells([], [[0, 0, 10, 10]])["box"].shape == (0, 4)
+    assert extract_cells([[0, 0, 10, 10]], [])["box"].shape == (0, 4)
+
+
+def test_filter_contained_cells_within_spancell():
+    row_boxes = [[0, 0, 100, 10], [0, 10, 100, 20]]
+    col_boxes = [[0, 0, 50, 20], [50, 0, 100, 20]]
+    span_boxes = [[0, 0, 50, 20], [300, 300, 400, 400]]
+
+    cells = extract_cells(row_boxes, col_boxes)
+    cells = filter_contained_cells_within_spancell(cells, span_boxes)
+
+    assert len(cells) == 3
+
+    assert cells[0]["row"] == 1
+    assert cells[0]["col"] == 1
+    assert cells[0]["row_span"] == 2
+    assert cells[0]["col_span"] == 1
+    assert cells[0]["box"] == [0, 0, 50, 20]
+
+    assert [(cell["row"], cell["col"]) for cell in cells[1:]] == [(1, 2), (2, 2)]
+    for cell in cells:
+        assert cell["contents"] is None
+        assert all(isinstance(v, int) for v in cell["box"])
+
+
+def test_filter_contained_cells_without_spancell():
+    cells = extract_cells([[0, 0, 100, 10]], [[0, 0, 50, 10], [50, 0, 100, 10]])
+    cells = filter_contained_cells_within_spancell(cells, [])
+
+    assert [(cell["row"], cell["col"]) for cell in cells] == [(1, 1), (1, 2)]
+    assert all(cell["row_span"] == 1 for cell in cells)
+
+
+def test_half_fallback_on_cpu():
+    recognizer = TableStructureRecognizer(device="cpu", use_half=True)
+
+    assert recognizer.device == torch.device("cpu")
+    assert recognizer.use_half is False
+
+
+def test_table_structure_recognizer():
+    recognizer = TableStructureRecognizer(device="cpu")
+    img = load_image("tests/data/test.jpg")
+    table_boxes = [[10, 20, 300, 400], [50, 450, 580, 800]]
+
+    results, _ = recognizer(img, table_boxes)
+
+    assert len(results) == len(table_boxes)
+    for result, box in zip(results, table_boxes):
+        assert result.box == box
+        assert result.n_row >= 0
+        assert result.n_col >= 0
+
+    results, _ = recognizer(img, [])
+    assert results == []
+
+
+def test_table_structure_recognizer_padding():
+    recognizer = TableStructureRecognizer(device="cpu")
+    img = load_image("tests/data/test.jpg")
+    table_boxes = [[10, 20, 300, 400], [50, 450, 580, 800], [0, 0, 100, 100]]
+
+    # CPUではコンパイルしないため、パディングのみを有効にする
+    recognizer.use_compile = True
+    img_tensor, table_imgs = recognizer.preprocess(img, table_boxes)
+    assert img_tensor.shape[0] == 4
+    assert [data["offset"] for data in table_imgs] == [
+        tuple(box[:2]) for box in table_boxes
+    ]
+
+    results, _ = recognizer(img, table_boxes)
+    assert [result.box for result in results] == table_boxes
+
+
+def test_to_device_cpu():
+    recognizer = TableStructureRecognizer(device="cpu")
+    img = np.random.randint(0, 256, (32, 48, 3), dtype=np.uint8)[:, :, ::-1]
+
+    img_tensor = recognizer.to_device(img)
+
+    assert img_tensor.device == torch.device("cpu")
+    assert img_tensor.dtype == torch.uint8
+    assert np.array_equal(img_tensor.numpy(), img)
+    assert recognizer._staging is None
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA is not available")
+def test_to_device_cuda_reuses_staging():
+    recognizer = TableStructureRecognizer(device="cuda")
+
+    img = np.random.randint(0, 256, (64, 64, 3), dtype=np.uint8)
+    img_tensor = recognizer.to_device(img)
+    staging = recognizer._staging
+    assert staging.is_pinned()
+    assert np.array_equal(img_tensor.cpu().numpy(), img)
+
+    # 小さい画像ではバッファを使い回す
+    img = np.random.randint(0, 256, (32, 48, 3), dtype=np.uint8)
+    img_tensor = recognizer.to_device(img)
+    assert recognizer._staging is staging
+    assert np.array_equal(img_tensor.cpu().numpy(), img)
+
+    # 大きい画像ではバッファを拡張する
+    img = np.random.randint(0, 256, (128, 96, 3), dtype=np.uint8)
+    img_tensor = recognizer.to_device(img)
+    assert recognizer._staging is not staging
+    assert recognizer._staging.numel() >= img.size
+    assert np.array_equal(img_tensor.cpu().numpy(), img)
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA is not available")
+def test_table_structure_recognizer_half_cuda():
+    recognizer = TableStructureRecognizer(device="cuda", use_half=True)
+    assert recognizer.use_half is True
+
+    img = load_image("tests/data/test.jpg")
+    table_boxes = [[10, 20, 300, 400], [50, 450, 580, 800]]
+
+    results, _ = recognizer(img, table_boxes)
+
+    assert [result.box for result in results] == table_boxes
+    for result in results:
+        for cell in result.cells:
+            assert all(isinstance(v, int) for v in cell.box)